@@ -1,7 +1,13 @@
-from typing import Annotated, List, TypedDict
+from typing import Annotated, AsyncIterator, Iterator, List, TypedDict
 from pydantic import BaseModel, Field
+from dataclasses import dataclass
+from functools import lru_cache
 from datetime import datetime
 import operator
+import re
+import numpy as np
+import asyncio
+import threading
 from dotenv import load_dotenv
 import os
 
@@ -12,20 +18,73 @@ load_dotenv()
 if not os.getenv("OPENAI_API_KEY"):
     raise ValueError("OPENAI_API_KEY not found in environment variables. Please check your .env file.")
 
+from langchain_core.caches import InMemoryCache
 from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
 from langchain_openai import ChatOpenAI
 from langgraph.graph import END, MessagesState, START, StateGraph
 
 ### LLM
-llm = ChatOpenAI(model="gpt-4", temperature=0.7)  
+# The monthly summary gets the strongest model; short insights and alerts use a cheaper, faster one
+llm = ChatOpenAI(model="gpt-4o", temperature=0.7)
+fast_llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.7)
+# Insights are generated deterministically so repeated category totals can be served from cache
+insight_llm = ChatOpenAI(model="gpt-4o-mini", temperature=0, cache=InMemoryCache(maxsize=256))
+
+### Prompts
+# Static instructions are sent as their own leading system message, with the per-run
+# numbers in a second one, so every call shares an identical cacheable prompt prefix
+COACH_INSTRUCTIONS = """You are a passive-aggressive budget coach. Your responses should be:
+1. Snarky but not mean
+2. Include specific details about spending
+3. End with a helpful suggestion
+4. Use emojis sparingly
+5. Keep it concise
+6. Format numbers with proper spacing and commas (e.g., "$1,234.56" not "$1234.56")
+7. Use proper spacing between sentences and after punctuation
+8. Use markdown formatting for emphasis where appropriate
+
+Base your response on the user's transactions and their question."""
+
+INSIGHT_INSTRUCTIONS = """You are a passive-aggressive budget coach. Generate a snarky but helpful insight about spending in each of the categories listed in the next message.
+
+Return one entry per category, using the category name exactly as given, with a snarky comment and a separate helpful suggestion.
+Make each entry:
+1. Snarky but not mean
+2. Use emojis sparingly
+3. Keep the comment and the suggestion to one sentence each
+4. Format all numbers with proper spacing and commas
+5. Use plain text without markdown"""
+
+SUMMARY_INSTRUCTIONS = """You are a passive-aggressive budget coach. Generate a monthly spending summary from the figures in the next message.
+
+Make your response:
+1. Start with a snarky observation about overall spending
+2. Include specific category breakdowns
+3. End with a passive-aggressive but helpful tip
+4. Use markdown formatting
+5. Format all numbers with proper spacing and commas
+6. Use proper spacing between sentences
+7. Do not split numbers across lines"""
+
+ALERT_INSTRUCTIONS = """You are a passive-aggressive budget coach. Generate an alert about excessive spending from the figures in the next message.
+
+Make your response:
+1. Start with a dramatic observation about spending
+2. Include specific examples of "interesting" purchases
+3. End with a sarcastic but practical suggestion
+4. Use emojis for extra passive-aggressive effect
+5. Format all numbers with proper spacing and commas
+6. Use proper spacing between sentences
+7. Do not split numbers across lines"""
 
 ### Schema
-class Transaction(BaseModel):
-    date: datetime = Field(description="Date of the transaction")
-    amount: float = Field(description="Amount spent")
-    category: str = Field(description="Category of spending")
-    description: str = Field(description="Description of the transaction")
-    merchant: str = Field(description="Name of the merchant")
+@dataclass(slots=True, frozen=True)
+class Transaction:
+    date: datetime  # Date of the transaction
+    amount: float  # Amount spent
+    category: str  # Category of spending
+    description: str  # Description of the transaction
+    merchant: str  # Name of the merchant
 
 class SpendingInsight(BaseModel):
     category: str = Field(description="Category of spending being analyzed")
@@ -34,12 +93,39 @@ class SpendingInsight(BaseModel):
     snarky_comment: str = Field(description="A passive-aggressive comment about the spending")
     helpful_suggestion: str = Field(description="A helpful suggestion to improve spending")
 
+class CategoryComment(BaseModel):
+    category: str = Field(description="Category the comment is about, exactly as given")
+    snarky_comment: str = Field(description="A passive-aggressive comment about the spending")
+    helpful_suggestion: str = Field(description="A helpful suggestion to improve spending")
+
+class CategoryComments(BaseModel):
+    comments: List[CategoryComment] = Field(description="One comment per category, in the order given")
+
 class BudgetCoachState(MessagesState):
     transactions: List[Transaction] = Field(default_factory=list)
     insights: List[SpendingInsight] = Field(default_factory=list)
     monthly_budget: float = Field(default=0.0)
     current_month_spending: float = Field(default=0.0)
 
+_loop: asyncio.AbstractEventLoop | None = None
+_loop_lock = threading.Lock()
+
+def _background_loop() -> asyncio.AbstractEventLoop:
+    """Event loop that runs the async graph for synchronous callers.
+    
+    One long-lived loop, rather than asyncio.run per call, keeps the LLM clients'
+    pooled async connections bound to a loop that stays open. It is started on first
+    use under a lock, so concurrent first callers still share a single loop.
+    """
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="budget-coach-loop", daemon=True).start()
+                _loop = loop
+    return _loop
+
 class BudgetCoach:
     def __init__(self, transactions: List[Transaction], monthly_budget: float = 5000.0):
         self.transactions = transactions
@@ -48,127 +134,196 @@ class BudgetCoach:
             transactions=transactions,
             monthly_budget=monthly_budget
         )
-        self.graph = budget_coach.compile()
+        # Every coach shares the module-level compiled graph; the topology never changes
+        self.graph = graph
 
     def get_response(self, prompt: str) -> str:
         """Get a response from the budget coach based on the user's prompt"""
-        system_message = """You are a passive-aggressive budget coach. Your responses should be:
-        1. Snarky but not mean
-        2. Include specific details about spending
-        3. End with a helpful suggestion
-        4. Use emojis sparingly
-        5. Keep it concise
-        6. Format numbers with proper spacing and commas (e.g., "$1,234.56" not "$1234.56")
-        7. Use proper spacing between sentences and after punctuation
-        8. Use markdown formatting for emphasis where appropriate
-        
-        Base your response on the user's transactions and their question."""
-        
+        return asyncio.run_coroutine_threadsafe(self.aget_response(prompt), _background_loop()).result()
+
+    async def aget_response(self, prompt: str) -> str:
+        """Async version of get_response, for callers already running an event loop"""
         # Run the graph to analyze transactions and generate insights
-        result = self.graph.invoke({
+        result = await self.graph.ainvoke(self._graph_input(prompt))
+        return self._reply_from_result(result)
+
+    async def astream_response(self, prompt: str) -> AsyncIterator[str]:
+        """Stream the budget coach's reply token by token as the LLM generates it"""
+        streamed_node = None
+        # The punctuation fix-up looks one character ahead, so the last character of each
+        # chunk is held back until the next one arrives; the stream then matches get_response
+        held = ""
+        async for event in self.graph.astream_events(self._graph_input(prompt), version="v2"):
+            node = event["metadata"].get("langgraph_node")
+            if event["event"] == "on_chat_model_stream" and node in ("generate_summary", "send_alert"):
+                content = event["data"]["chunk"].content
+                if not content:
+                    continue
+                # Keep the summary and a following alert as separate paragraphs
+                if streamed_node is not None and node != streamed_node:
+                    yield held + "\n\n"
+                    held = ""
+                streamed_node = node
+                text = MISSING_SPACE_AFTER_PUNCTUATION.sub(r"\1 ", held + content)
+                held = text[-1]
+                if len(text) > 1:
+                    yield text[:-1]
+            elif event["event"] == "on_chain_end" and not event["parent_ids"] and streamed_node is None:
+                # Nothing was streamed (e.g. only insights were needed), so send the final reply at once
+                yield self._reply_from_result(event["data"]["output"])
+        if held:
+            yield held
+
+    def stream_response(self, prompt: str) -> Iterator[str]:
+        """Synchronous version of astream_response, e.g. for st.write_stream"""
+        loop = _background_loop()
+        chunks = self.astream_response(prompt)
+        try:
+            while True:
+                try:
+                    yield asyncio.run_coroutine_threadsafe(anext(chunks), loop).result()
+                except StopAsyncIteration:
+                    return
+        finally:
+            asyncio.run_coroutine_threadsafe(chunks.aclose(), loop).result()
+
+    def _graph_input(self, prompt: str) -> dict:
+        """Build the graph input for a single user prompt"""
+        return {
             "messages": [
-                SystemMessage(content=system_message),
+                SystemMessage(content=COACH_INSTRUCTIONS),
                 HumanMessage(content=prompt)
             ],
             "transactions": self.transactions,
             "monthly_budget": self.monthly_budget
-        })
-        
-        # Get the last message from the result
-        if result["messages"]:
-            response = result["messages"][-1].content
-            # Ensure proper spacing around numbers
-            response = response.replace("$", " $").replace("$ ", "$")
+        }
+
+    def _reply_from_result(self, result: dict) -> str:
+        """Extract the user-facing reply from the final graph state"""
+        # Join every AI message produced for this prompt (a summary may be followed by an
+        # alert), matching what astream_response streams; fall back to the category
+        # insights when the graph decided no summary or alert was needed
+        messages = result["messages"]
+        last_prompt = max((i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), default=-1)
+        replies = [m.content for m in messages[last_prompt + 1:] if isinstance(m, AIMessage) and m.content]
+        response = None
+        if replies:
+            response = "\n\n".join(replies)
+        elif result["insights"]:
+            response = "\n\n".join(f"**{i.category}**: {i.snarky_comment} {i.helpful_suggestion}".rstrip() for i in result["insights"])
+        if response:
             # Ensure proper spacing after punctuation
-            response = response.replace(".", ". ").replace("!", "! ").replace("?", "? ")
-            return response
+            return MISSING_SPACE_AFTER_PUNCTUATION.sub(r"\1 ", response)
         return "I'm currently analyzing your questionable financial decisions... 🤔"
 
 ### Nodes and edges
 
+SUMMARY_REQUEST = re.compile(r"\b(summary|summari[sz]e|report|overview)\b", re.IGNORECASE)
+# Sentence punctuation run directly into the next word; decimals like $1,234.56 are left alone
+MISSING_SPACE_AFTER_PUNCTUATION = re.compile(r"([.!?])(?=[^\W\d_])")
+
+@lru_cache(maxsize=1024)
 def format_currency(amount: float) -> str:
     """Format a number as currency with proper spacing and commas"""
     return f"${amount:,.2f}"
 
-def analyze_transactions(state: BudgetCoachState):
+async def analyze_transactions(state: BudgetCoachState):
     """Analyze transactions and generate snarky insights"""
     
     # Group transactions by category
+    transactions = state["transactions"]
     category_spending = {}
-    for transaction in state["transactions"]:
-        if transaction.category not in category_spending:
-            category_spending[transaction.category] = {
-                "total": 0.0,
-                "count": 0,
-                "transactions": []
+    if transactions:
+        # Index each category in first-seen order, then reduce the amounts per index
+        category_index = {}
+        cat_idx = np.fromiter(
+            (category_index.setdefault(t.category, len(category_index)) for t in transactions),
+            dtype=np.intp,
+            count=len(transactions)
+        )
+        amounts = np.fromiter((t.amount for t in transactions), dtype=np.float64, count=len(transactions))
+        totals = np.bincount(cat_idx, weights=amounts)
+        counts = np.bincount(cat_idx)
+        
+        # Positions sorted by category (stable, so each run stays chronological) for the recent-3 lookup
+        by_category = np.argsort(cat_idx, kind="stable")
+        ends = np.cumsum(counts)
+        for category, k in category_index.items():
+            recent = by_category[ends[k] - min(3, counts[k]):ends[k]]
+            category_spending[category] = {
+                "total": float(totals[k]),
+                "count": int(counts[k]),
+                "transactions": [transactions[i] for i in recent]
             }
-        category_spending[transaction.category]["total"] += transaction.amount
-        category_spending[transaction.category]["count"] += 1
-        category_spending[transaction.category]["transactions"].append(transaction)
 
-    # Generate insights for each category
+    # Describe every category in one prompt so the model answers them all in a single call
+    category_lines = []
+    for i, (category, data) in enumerate(category_spending.items(), start=1):
+        recent = ", ".join(f"{format_currency(t.amount)} at {t.merchant}" for t in data['transactions'][-3:])
+        category_lines.append(
+            f"{i}. {category}: total={format_currency(round(data['total']))}, count={data['count']}, recent=[{recent}]"
+        )
+    
     insights = []
-    for category, data in category_spending.items():
-        formatted_amount = format_currency(data['total'])
-        system_message = f"""You are a passive-aggressive budget coach. Generate a snarky but helpful insight about spending in the {category} category.
-        
-        Total spent: {formatted_amount}
-        Number of transactions: {data['count']}
+    if category_spending:
+        response = await insight_llm.with_structured_output(CategoryComments).ainvoke([
+            SystemMessage(content=INSIGHT_INSTRUCTIONS),
+            SystemMessage(content="\n".join(category_lines))
+        ])
+        comments = {c.category: c for c in response.comments}
+        # The model is asked to keep the given order, so when it renames a category but still
+        # returns one comment per category, the entry at the same position belongs to it
+        by_position = len(response.comments) == len(category_spending)
         
-        Recent transactions:
-        {chr(10).join(f"- {format_currency(t.amount)} at {t.merchant}" for t in data['transactions'][-3:])}
-        
-        Make your response:
-        1. Snarky but not mean
-        2. Include a helpful suggestion
-        3. Use emojis sparingly
-        4. Keep it concise (2-3 sentences)
-        5. Format all numbers with proper spacing and commas
-        6. Do not split numbers across lines
-        7. Use proper spacing between sentences
-        """
-        
-        response = llm.invoke([SystemMessage(content=system_message)])
-        
-        insight = SpendingInsight(
-            category=category,
-            total_spent=data["total"],
-            num_transactions=data["count"],
-            snarky_comment=response.content,
-            helpful_suggestion=""
-        )
-        insights.append(insight)
+        for i, (category, data) in enumerate(category_spending.items()):
+            comment = comments.get(category)
+            if comment is None and by_position:
+                comment = response.comments[i]
+            insight = SpendingInsight(
+                category=category,
+                total_spent=data["total"],
+                num_transactions=data["count"],
+                snarky_comment=comment.snarky_comment if comment else "",
+                helpful_suggestion=comment.helpful_suggestion if comment else ""
+            )
+            insights.append(insight)
 
-    return {"insights": insights}
+    return {
+        "insights": insights,
+        "current_month_spending": sum(data["total"] for data in category_spending.values())
+    }
 
-def generate_monthly_summary(state: BudgetCoachState):
+async def generate_monthly_summary(state: BudgetCoachState):
     """Generate a monthly spending summary with passive-aggressive commentary"""
     
-    total_spent = sum(t.amount for t in state["transactions"])
+    total_spent = state["current_month_spending"]
     budget = state["monthly_budget"]
     
-    system_message = f"""You are a passive-aggressive budget coach. Generate a monthly spending summary.
+    figures = f"""Monthly Budget: {format_currency(budget)}
+Total Spent: {format_currency(total_spent)}
+Remaining: {format_currency(budget - total_spent)}"""
     
-    Monthly Budget: {format_currency(budget)}
-    Total Spent: {format_currency(total_spent)}
-    Remaining: {format_currency(budget - total_spent)}
+    summary = await llm.ainvoke([SystemMessage(content=SUMMARY_INSTRUCTIONS), SystemMessage(content=figures)])
     
-    Make your response:
-    1. Start with a snarky observation about overall spending
-    2. Include specific category breakdowns
-    3. End with a passive-aggressive but helpful tip
-    4. Use markdown formatting
-    5. Format all numbers with proper spacing and commas
-    6. Use proper spacing between sentences
-    7. Do not split numbers across lines
-    """
+    return {"messages": [AIMessage(content=summary.content)]}
+
+def classify_intent(state: BudgetCoachState):
+    """Decide which of the summary and alert calls the user's request actually needs"""
     
-    summary = llm.invoke([SystemMessage(content=system_message)])
+    total_spent = state["current_month_spending"]
+    budget = state["monthly_budget"]
+    prompt = next((m.content for m in reversed(state["messages"]) if isinstance(m, HumanMessage)), None)
     
-    return {
-        "current_month_spending": total_spent,
-        "messages": [AIMessage(content=summary.content)]
-    }
+    # Direct graph runs without a question, and explicit requests, get the full summary
+    if prompt is None or SUMMARY_REQUEST.search(prompt):
+        return "summary"
+    # Over 80% of budget, the alert is the only thing worth saying
+    if total_spent > (budget * 0.8):
+        return "alert_only"
+    # Comfortably under budget, the category insights are answer enough
+    if total_spent < (budget * 0.5):
+        return "done"
+    return "summary"
 
 def should_send_alert(state: BudgetCoachState):
     """Determine if we should send a spending alert"""
@@ -181,29 +336,17 @@ def should_send_alert(state: BudgetCoachState):
         return "send_alert"
     return END
 
-def send_spending_alert(state: BudgetCoachState):
+async def send_spending_alert(state: BudgetCoachState):
     """Generate and send a passive-aggressive spending alert"""
     
     total_spent = state["current_month_spending"]
     budget = state["monthly_budget"]
     
-    system_message = f"""You are a passive-aggressive budget coach. Generate an alert about excessive spending.
-    
-    Monthly Budget: {format_currency(budget)}
-    Total Spent: {format_currency(total_spent)}
-    Remaining: {format_currency(budget - total_spent)}
-    
-    Make your response:
-    1. Start with a dramatic observation about spending
-    2. Include specific examples of "interesting" purchases
-    3. End with a sarcastic but practical suggestion
-    4. Use emojis for extra passive-aggressive effect
-    5. Format all numbers with proper spacing and commas
-    6. Use proper spacing between sentences
-    7. Do not split numbers across lines
-    """
+    figures = f"""Monthly Budget: {format_currency(budget)}
+Total Spent: {format_currency(total_spent)}
+Remaining: {format_currency(budget - total_spent)}"""
     
-    alert = llm.invoke([SystemMessage(content=system_message)])
+    alert = await fast_llm.ainvoke([SystemMessage(content=ALERT_INSTRUCTIONS), SystemMessage(content=figures)])
     
     return {"messages": [AIMessage(content=alert.content)]}
 
@@ -217,7 +360,11 @@ budget_coach.add_node("send_alert", send_spending_alert)
 
 # Add edges
 budget_coach.add_edge(START, "analyze_transactions")
-budget_coach.add_edge("analyze_transactions", "generate_summary")
+budget_coach.add_conditional_edges(
+    "analyze_transactions",
+    classify_intent,
+    {"summary": "generate_summary", "alert_only": "send_alert", "done": END}
+)
 budget_coach.add_conditional_edges("generate_summary", should_send_alert, ["send_alert", END])
 budget_coach.add_edge("send_alert", END)
 
@@ -1,3 +1,4 @@
+import asyncio
 from datetime import datetime
 from dotenv import load_dotenv
 import os
@@ -34,7 +35,7 @@ initial_state = BudgetCoachState(
 )
 
 # Run the graph
-result = graph.invoke(initial_state)
+result = asyncio.run(graph.ainvoke(initial_state))
 
 # Print the results
 print("\n=== Budget Coach Insights ===\n")
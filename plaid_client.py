@@ -0,0 +1,26 @@
+from functools import lru_cache
+import plaid
+from plaid.api import plaid_api
+
+@lru_cache(maxsize=None)
+def get_plaid_client(client_id: str, secret: str, host: str = plaid.Environment.Sandbox) -> plaid_api.PlaidApi:
+    """
+    Get a Plaid API client for the given credentials.
+    
+    Clients are cached per (client_id, secret, host), so every caller in the process
+    shares one ApiClient and its urllib3 connection pool instead of paying for a new
+    TCP/TLS handshake on each fetch.
+    
+    Args:
+        client_id: Your Plaid client ID
+        secret: Your Plaid secret
+        host: Plaid environment to talk to (Sandbox by default for testing)
+    """
+    configuration = plaid.Configuration(
+        host=host,
+        api_key={
+            'clientId': client_id,
+            'secret': secret,
+        }
+    )
+    return plaid_api.PlaidApi(plaid.ApiClient(configuration))
@@ -5,7 +5,7 @@ from plaid.model.link_token_create_request_user import LinkTokenCreateRequestUse
 from plaid.model.products import Products
 from plaid.model.country_code import CountryCode
 from plaid.model.item_public_token_exchange_request import ItemPublicTokenExchangeRequest
-from plaid.api import plaid_api
+from plaid_client import get_plaid_client
 from dotenv import load_dotenv
 import os
 from pathlib import Path
@@ -20,15 +20,7 @@ print("PLAID_CLIENT_ID:", os.getenv('PLAID_CLIENT_ID')[:5] + "..." if os.getenv(
 print("PLAID_SECRET:", os.getenv('PLAID_SECRET')[:5] + "..." if os.getenv('PLAID_SECRET') else "Not found")
 
 # Configure Plaid client
-configuration = plaid.Configuration(
-    host=plaid.Environment.Sandbox,  # Changed back to Sandbox for testing
-    api_key={
-        'clientId': os.getenv('PLAID_CLIENT_ID'),
-        'secret': os.getenv('PLAID_SECRET'),
-    }
-)
-api_client = plaid.ApiClient(configuration)
-client = plaid_api.PlaidApi(api_client)
+client = get_plaid_client(os.getenv('PLAID_CLIENT_ID'), os.getenv('PLAID_SECRET'))
 
 @app.route('/')
 def index():
@@ -1,4 +1,7 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+import re
 from typing import List
 import plaid
 from plaid.model.transactions_get_request import TransactionsGetRequest
@@ -6,10 +9,25 @@ from plaid.model.transactions_get_request_options import TransactionsGetRequestO
 from plaid.model.products import Products
 from plaid.model.country_code import CountryCode
 from plaid.model.transactions_get_response import TransactionsGetResponse
-from plaid.api import plaid_api
 from budget_coach import Transaction
+from plaid_client import get_plaid_client
+
+# Largest page /transactions/get will return in one request
+MAX_PAGE_SIZE = 500
+# Upper bound on page requests in flight at once
+MAX_CONCURRENT_PAGES = 8
 
 class PlaidTransactionFetcher:
+    # Keyword patterns checked in order; the first match decides the category
+    _CATEGORY_PATTERNS = [
+        (re.compile(r'restaurant|cafe|coffee|bar|pub|food|dining'), 'Dining'),
+        (re.compile(r'amazon|walmart|target|store|shop|retail'), 'Shopping'),
+        (re.compile(r'netflix|spotify|hulu|entertainment|movie|theater'), 'Entertainment'),
+        (re.compile(r'united|airline|hotel|travel|flight'), 'Travel'),
+        (re.compile(r'uber|lyft|taxi|transit|parking'), 'Transportation'),
+        (re.compile(r'electric|water|gas|utility|internet|phone'), 'Utilities'),
+    ]
+
     def __init__(self, client_id: str, secret: str, access_token: str):
         """
         Initialize Plaid client with your credentials.
@@ -19,51 +37,45 @@ class PlaidTransactionFetcher:
             secret: Your Plaid secret
             access_token: The access token for your Chase United Explorer card
         """
-        configuration = plaid.Configuration(
-            host=plaid.Environment.Sandbox,  # Changed back to Sandbox for testing
-            api_key={
-                'clientId': client_id,
-                'secret': secret,
-            }
-        )
-        self.api_client = plaid.ApiClient(configuration)
-        self.client = plaid_api.PlaidApi(self.api_client)
+        self.client = get_plaid_client(client_id, secret)
         self.access_token = access_token
 
-    def get_recent_transactions(self, days_back: int = 30) -> List[Transaction]:
+    def get_recent_transactions(self, days_back: int = 30, page_size: int = MAX_PAGE_SIZE) -> List[Transaction]:
         """
         Fetch recent transactions from Plaid.
         
         Args:
             days_back: Number of days of transactions to fetch
+            page_size: Transactions requested per call (at most MAX_PAGE_SIZE)
             
         Returns:
             List of Transaction objects
         """
+        if not 1 <= page_size <= MAX_PAGE_SIZE:
+            raise ValueError(f"page_size must be between 1 and {MAX_PAGE_SIZE}, got {page_size}")
+        
         # Calculate date range
-        end_date = datetime.now()
+        end_date = datetime.now().date()
         start_date = end_date - timedelta(days=days_back)
         
-        # Create request
-        request = TransactionsGetRequest(
-            access_token=self.access_token,
-            start_date=start_date.date(),
-            end_date=end_date.date(),
-            options=TransactionsGetRequestOptions(
-                count=500,  # Adjust based on your needs
-                offset=0
-            )
-        )
-        
         try:
-            # Get transactions
-            response = self.client.transactions_get(request)
-            transactions = response.transactions
+            # Get transactions; the first page reports how many exist, and any remaining
+            # pages are then requested concurrently on worker threads
+            first_page = self._fetch_page(start_date, end_date, 0, page_size)
+            transactions = list(first_page.transactions)
+            
+            offsets = range(page_size, first_page.total_transactions, page_size)
+            if offsets:
+                with ThreadPoolExecutor(max_workers=min(len(offsets), MAX_CONCURRENT_PAGES)) as pool:
+                    pages = pool.map(lambda offset: self._fetch_page(start_date, end_date, offset, page_size), offsets)
+                    for page in pages:
+                        transactions.extend(page.transactions)
             
             # Convert to our Transaction model
+            midnight = datetime.min.time()
             return [
                 Transaction(
-                    date=datetime.combine(t.date, datetime.min.time()),  # Convert date to datetime
+                    date=datetime.combine(t.date, midnight),  # Convert date to datetime
                     amount=float(t.amount),
                     category=self._map_plaid_category(t.category),
                     description=t.name,
@@ -76,6 +88,28 @@ class PlaidTransactionFetcher:
             print(f"Error fetching transactions: {e}")
             return []
 
+    async def aget_recent_transactions(self, days_back: int = 30, page_size: int = MAX_PAGE_SIZE) -> List[Transaction]:
+        """
+        Async version of get_recent_transactions, run on a worker thread so the event
+        loop stays free while Plaid responds.
+        """
+        return await asyncio.to_thread(self.get_recent_transactions, days_back, page_size)
+
+    def _fetch_page(self, start_date, end_date, offset: int, page_size: int) -> TransactionsGetResponse:
+        """
+        Fetch a single page of up to page_size transactions starting at the given offset.
+        """
+        request = TransactionsGetRequest(
+            access_token=self.access_token,
+            start_date=start_date,
+            end_date=end_date,
+            options=TransactionsGetRequestOptions(
+                count=page_size,
+                offset=offset
+            )
+        )
+        return self.client.transactions_get(request)
+
     def _map_plaid_category(self, plaid_category: List[str]) -> str:
         """
         Map Plaid categories to our budget coach categories.
@@ -85,28 +119,8 @@ class PlaidTransactionFetcher:
             
         category = plaid_category[0].lower()
         
-        # Dining categories
-        if any(word in category for word in ['restaurant', 'cafe', 'coffee', 'bar', 'pub', 'food', 'dining']):
-            return 'Dining'
-        
-        # Shopping categories
-        if any(word in category for word in ['amazon', 'walmart', 'target', 'store', 'shop', 'retail']):
-            return 'Shopping'
-        
-        # Entertainment categories
-        if any(word in category for word in ['netflix', 'spotify', 'hulu', 'entertainment', 'movie', 'theater']):
-            return 'Entertainment'
-        
-        # Travel categories
-        if any(word in category for word in ['united', 'airline', 'hotel', 'travel', 'flight']):
-            return 'Travel'
-        
-        # Transportation categories
-        if any(word in category for word in ['uber', 'lyft', 'taxi', 'transit', 'parking']):
-            return 'Transportation'
-        
-        # Utilities categories
-        if any(word in category for word in ['electric', 'water', 'gas', 'utility', 'internet', 'phone']):
-            return 'Utilities'
+        for pattern, label in self._CATEGORY_PATTERNS:
+            if pattern.search(category):
+                return label
         
         return 'Other' 
\ No newline at end of file
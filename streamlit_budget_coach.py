@@ -1,13 +1,18 @@
 import streamlit as st
-from budget_coach import BudgetCoach
-from plaid_transactions import PlaidTransactionFetcher
+from budget_coach import MISSING_SPACE_AFTER_PUNCTUATION, BudgetCoach
+from plaid_transactions import MAX_PAGE_SIZE, PlaidTransactionFetcher
 import os
 from dotenv import load_dotenv
-import re
 
-# Load environment variables
+# Load environment variables. This runs on every rerun on purpose, so a PLAID_ACCESS_TOKEN
+# that plaid_link.py appends to .env is picked up without restarting the app
 load_dotenv()
 
+# Plaid settings, read once per run and passed to _load_transactions below
+PLAID_CLIENT_ID = os.getenv('PLAID_CLIENT_ID')
+PLAID_SECRET = os.getenv('PLAID_SECRET')
+PLAID_ACCESS_TOKEN = os.getenv('PLAID_ACCESS_TOKEN')
+
 # Initialize session state
 if 'messages' not in st.session_state:
     st.session_state.messages = []
@@ -16,19 +21,71 @@ if 'budget_coach' not in st.session_state:
 if 'current_budget' not in st.session_state:
     st.session_state.current_budget = 5000.0
 
-def format_message(message: str) -> str:
-    """Format the message to ensure proper spacing and line breaks"""
+_DOLLAR_ESCAPE = str.maketrans({"$": "\\$"})
+
+def format_user(message: str) -> str:
+    """Format a user message for display, leaving the user's own spacing alone"""
     # Escape dollar signs to prevent LaTeX interpretation
-    message = message.replace("$", "\\$")
-    # Replace multiple spaces with single space
-    message = re.sub(r'\s+', ' ', message)
-    # Ensure proper spacing around numbers
-    message = re.sub(r'(\d+\.?\d*)', r' \1 ', message)
-    # Ensure proper spacing after punctuation
-    message = re.sub(r'([.!?])([^\s])', r'\1 \2', message)
-    # Clean up any double spaces
-    message = re.sub(r'\s+', ' ', message)
-    return message.strip()
+    return message.translate(_DOLLAR_ESCAPE)
+
+def format_assistant(message: str) -> str:
+    """Format a coach reply for display, keeping its markdown line breaks and numbers intact"""
+    # Escape dollar signs to prevent LaTeX interpretation
+    message = message.translate(_DOLLAR_ESCAPE)
+    # Ensure proper spacing after punctuation (streamed replies skip the coach's own cleanup)
+    return MISSING_SPACE_AFTER_PUNCTUATION.sub(r"\1 ", message).strip()
+
+@st.cache_data(ttl=300, show_spinner="Fetching your transactions...")
+def _load_transactions(client_id: str, secret: str, access_token: str):
+    """Fetch recent Plaid transactions, shared across reruns and sessions for a few minutes"""
+    fetcher = PlaidTransactionFetcher(
+        client_id=client_id,
+        secret=secret,
+        access_token=access_token
+    )
+    # Ask for Plaid's largest page so a typical month arrives in a single request
+    return fetcher.get_recent_transactions(page_size=MAX_PAGE_SIZE)
+
+def _stream_reply(prompt: str) -> str:
+    """Stream the coach's reply into the current container and return the raw text"""
+    chunks = []
+    def escaped_chunks():
+        for chunk in st.session_state.budget_coach.stream_response(prompt):
+            chunks.append(chunk)
+            # Escape dollar signs as they arrive to prevent LaTeX interpretation
+            yield chunk.translate(_DOLLAR_ESCAPE)
+    st.write_stream(escaped_chunks())
+    return "".join(chunks)
+
+@st.cache_data(ttl=60, show_spinner="Consulting your budget coach...")
+def _cached_response(prompt: str, monthly_budget: float, transactions_key: int, _coach: BudgetCoach) -> str:
+    """Get the coach's full response, reused while the prompt, budget and transactions are unchanged.
+    
+    Uses the same reply assembly as streaming, so a summary followed by an alert keeps both.
+    """
+    return _coach.get_response(prompt)
+
+def _ask(prompt: str, cached: bool = False):
+    """Answer a prompt and add the reply to the chat history.
+    
+    Uncached replies are streamed into an assistant chat message as they arrive; cached
+    replies are only appended, for the history loop to render on the next rerun.
+    """
+    if cached:
+        coach = st.session_state.budget_coach
+        response = _cached_response(prompt, coach.monthly_budget, st.session_state.transactions_key, coach)
+    else:
+        with st.chat_message("assistant"):
+            response = _stream_reply(prompt)
+    st.session_state.messages.append({"role": "assistant", "content": response, "formatted": format_assistant(response)})
+
+def _apply_budget():
+    """Update the budget coach when the budget input changes"""
+    monthly_budget = st.session_state.budget_input
+    st.session_state.current_budget = monthly_budget
+    if st.session_state.budget_coach is not None:
+        st.session_state.budget_coach.monthly_budget = monthly_budget
+        st.session_state.budget_coach.state["monthly_budget"] = monthly_budget
 
 # Page config
 st.set_page_config(
@@ -37,100 +94,97 @@ st.set_page_config(
     layout="wide"
 )
 
-# Title and description
-st.title("Passive-Aggressive Budget Coach 💰")
+# Title and description (static, so rendered as a single element)
 st.markdown("""
-    Welcome to your budget coach! I'll analyze your spending habits and provide some 
-    *constructive* feedback. Don't worry, I'm here to help... in my own special way.
+# Passive-Aggressive Budget Coach 💰
+
+Welcome to your budget coach! I'll analyze your spending habits and provide some 
+*constructive* feedback. Don't worry, I'm here to help... in my own special way.
 """)
 
 # Sidebar for configuration
 with st.sidebar:
     st.header("Settings")
-    monthly_budget = st.number_input(
+    # The coach is only updated from the callback, once per committed change
+    st.number_input(
         "Monthly Budget ($)",
         min_value=0.0,
         max_value=100000.0,
         value=st.session_state.current_budget,
-        step=100.0
+        step=100.0,
+        key="budget_input",
+        on_change=_apply_budget
     )
     
-    # Update budget coach if budget value changes
-    if monthly_budget != st.session_state.current_budget:
-        st.session_state.current_budget = monthly_budget
-        if st.session_state.budget_coach is not None:
-            st.session_state.budget_coach.monthly_budget = monthly_budget
-            st.session_state.budget_coach.state["monthly_budget"] = monthly_budget
-    
     if st.button("Connect Chase Card"):
         st.info("Please run 'python plaid_link.py' in your terminal to connect your card.")
 
 # Initialize budget coach if not already done
 if st.session_state.budget_coach is None:
     # Use Plaid transactions
-    fetcher = PlaidTransactionFetcher(
-        client_id=os.getenv('PLAID_CLIENT_ID'),
-        secret=os.getenv('PLAID_SECRET'),
-        access_token=os.getenv('PLAID_ACCESS_TOKEN')
-    )
-    transactions = fetcher.get_recent_transactions()
+    transactions = _load_transactions(PLAID_CLIENT_ID, PLAID_SECRET, PLAID_ACCESS_TOKEN)
+    if not transactions:
+        # The fetcher returns [] when Plaid errors; don't serve that to every new session
+        # until the TTL expires, let the next one retry instead
+        _load_transactions.clear()
+    # The coach itself stays per session because it holds this user's budget; it is only a thin
+    # wrapper around the process-wide compiled graph and LLM clients in budget_coach, which
+    # every session already shares, so there is nothing heavier to cache_resource here
     st.session_state.budget_coach = BudgetCoach(transactions, monthly_budget=st.session_state.current_budget)
+    # Identifies this transaction set in the response cache (Transaction is a frozen, hashable dataclass)
+    st.session_state.transactions_key = hash(tuple(transactions))
 
 # Main chat interface
 st.subheader("Chat with Your Budget Coach")
 
-# Display chat messages
-for message in st.session_state.messages:
-    with st.chat_message(message["role"]):
-        formatted_content = format_message(message["content"])
-        st.markdown(formatted_content)
-
-# Chat input
+# The chat area is a fragment: clicking a chat button reruns only this function, not the
+# page header, sidebar and coach setup around it
+@st.fragment
+def chat_area():
+    # Display chat messages (formatted once when they were added)
+    for message in st.session_state.messages:
+        with st.chat_message(message["role"]):
+            st.markdown(message["formatted"])
+
+    # Get coach's response to a prompt just submitted through the chat input. It is handed
+    # over through session state and popped, because fragment reruns reuse the arguments of
+    # the last full run and would otherwise answer the same prompt again
+    if prompt := st.session_state.pop("pending_prompt", None):
+        _ask(prompt)
+
+    # Add some helpful buttons
+    st.markdown("---")
+    col1, col2, col3 = st.columns(3)
+
+    with col1:
+        if st.button("Show Spending Summary"):
+            _ask("Give me a summary of my spending.", cached=True)
+            st.rerun()
+
+    with col2:
+        if st.button("Get Budget Tips"):
+            _ask("Give me some budget tips.", cached=True)
+            st.rerun()
+
+    with col3:
+        if st.button("Clear Chat"):
+            st.session_state.messages = []
+            st.rerun()
+
+# Chat input stays outside the fragment so Streamlit pins it to the bottom of the page;
+# submitting reruns the whole script, which is cheap with pre-formatted history
 if prompt := st.chat_input("Ask your budget coach anything..."):
     # Add user message to chat history
-    st.session_state.messages.append({"role": "user", "content": prompt})
-    with st.chat_message("user"):
-        st.markdown(prompt)
-
-    # Get coach's response
-    with st.chat_message("assistant"):
-        response = st.session_state.budget_coach.get_response(prompt)
-        formatted_response = format_message(response)
-        st.markdown(formatted_response)
-        st.session_state.messages.append({"role": "assistant", "content": formatted_response})
-
-# Add some helpful buttons
-st.markdown("---")
-col1, col2, col3 = st.columns(3)
-
-with col1:
-    if st.button("Show Spending Summary"):
-        with st.chat_message("assistant"):
-            response = st.session_state.budget_coach.get_response("Give me a summary of my spending.")
-            formatted_response = format_message(response)
-            st.markdown(formatted_response)
-            st.session_state.messages.append({"role": "assistant", "content": formatted_response})
+    st.session_state.messages.append({"role": "user", "content": prompt, "formatted": format_user(prompt)})
+    st.session_state.pending_prompt = prompt
 
-with col2:
-    if st.button("Get Budget Tips"):
-        with st.chat_message("assistant"):
-            response = st.session_state.budget_coach.get_response("Give me some budget tips.")
-            # Escape dollar signs in the response
-            response = response.replace("$", "\\$")
-            formatted_response = format_message(response)
-            st.markdown(formatted_response)
-            st.session_state.messages.append({"role": "assistant", "content": formatted_response})
-
-with col3:
-    if st.button("Clear Chat"):
-        st.session_state.messages = []
-        st.rerun()
-
-# Footer
-st.markdown("---")
+chat_area()
+
+# Footer (separator and credits in a single element)
 st.markdown("""
-    <div style='text-align: center'>
-        <p>Built with ❤️ and a dash of passive-aggressiveness</p>
-        <p>Powered by LangGraph and Plaid</p>
-    </div>
+---
+<div style='text-align: center'>
+    <p>Built with ❤️ and a dash of passive-aggressiveness</p>
+    <p>Powered by LangGraph and Plaid</p>
+</div>
 """, unsafe_allow_html=True) 
\ No newline at end of file